@@ -2,77 +2,237 @@ import pandas as pd
 import yfinance as yf
 from abc import ABC, abstractmethod
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+import contextvars
+import threading
+import random
+import time
+import os
 import logging
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+FETCH_TIMEOUT = 15  # 單一請求逾時秒數
+# 單一 Provider 內部的資料集並行 (與 fetch_concurrently 分開，避免巢狀等待佔滿同一個池)
+_dataset_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="dataset-fetch")
+
+# === 請求配額排程 (Token Bucket + 互動 / 批次兩條通道) ===
+INTERACTIVE = "interactive"   # 使用者即時查詢 (!a)
+BATCH = "batch"               # 訓練佇列、批次匯入、預熱等背景工作
+FINMIND_HOURLY_QUOTA = int(os.getenv("FINMIND_HOURLY_QUOTA", "600"))
+BATCH_RESERVE_RATIO = 0.2     # 批次工作不得動用最後 20% 額度，保留給互動查詢
+ACQUIRE_TIMEOUT = {INTERACTIVE: 30.0, BATCH: None}  # 互動查詢最多排隊 30 秒
+
+_request_lane = contextvars.ContextVar("bmo_request_lane", default=INTERACTIVE)
+
+@contextmanager
+def request_lane(lane: str):
+    """在此區塊內發出的請求 (含 fetch_concurrently 的子執行緒) 都歸屬指定通道"""
+    token = _request_lane.set(lane)
+    try:
+        yield
+    finally:
+        _request_lane.reset(token)
+
+def current_lane() -> str:
+    return _request_lane.get()
+
+def _is_throttle_error(e: Exception) -> bool:
+    msg = str(e).lower()
+    return "upper limit" in msg or "429" in msg or "402" in msg or "too many requests" in msg
+
+class RequestScheduler:
+    """
+    以 Token Bucket 追蹤每小時配額:
+    - 互動請求只要有 1 個 token 即可執行，且優先於批次請求
+    - 批次請求需在保留額度之上，且沒有互動請求在排隊時才執行
+    - 遇到限流回應時清空 token 並指數退避重試
+    """
+
+    def __init__(self, name: str, hourly_quota: int, batch_reserve_ratio: float = BATCH_RESERVE_RATIO,
+                 max_retries: int = 3, backoff_base: float = 2.0):
+        self.name = name
+        self.capacity = float(hourly_quota)
+        self.refill_rate = hourly_quota / 3600.0
+        self.reserve = self.capacity * batch_reserve_ratio
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._cond = threading.Condition()
+        self._waiting = {INTERACTIVE: 0, BATCH: 0}
+        self.metrics = {"requests": 0, "throttled": 0, "retries": 0, "timeouts": 0, "wait_seconds": 0.0}
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.refill_rate)
+        self._updated = now
+
+    def _can_take(self, lane: str, now: float) -> bool:
+        if now < self._paused_until: return False
+        if lane == INTERACTIVE: return self.tokens >= 1
+        return self._waiting[INTERACTIVE] == 0 and self.tokens >= 1 + self.reserve
+
+    def acquire(self, lane: Optional[str] = None, timeout: Optional[float] = None) -> bool:
+        lane = lane or current_lane()
+        started = time.monotonic()
+        deadline = None if timeout is None else started + timeout
+        with self._cond:
+            self._waiting[lane] += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    if self._can_take(lane, now):
+                        self.tokens -= 1
+                        self.metrics["requests"] += 1
+                        self.metrics["wait_seconds"] += now - started
+                        return True
+                    if deadline is not None and now >= deadline:
+                        self.metrics["timeouts"] += 1
+                        return False
+                    floor = 1 + (self.reserve if lane == BATCH else 0)
+                    wait = max(self._paused_until - now, (floor - self.tokens) / self.refill_rate, 0.05)
+                    if deadline is not None: wait = min(wait, deadline - now)
+                    self._cond.wait(wait)
+            finally:
+                self._waiting[lane] -= 1
+                self._cond.notify_all()
+
+    def call(self, fn: Callable, *args, **kwargs) -> Any:
+        """取得額度後執行 fn，限流時退避重試"""
+        lane = current_lane()
+        for attempt in range(self.max_retries + 1):
+            if not self.acquire(lane, timeout=ACQUIRE_TIMEOUT.get(lane)):
+                raise TimeoutError(f"{self.name} 配額不足，排隊逾時 ({lane})")
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                if not _is_throttle_error(e) or attempt == self.max_retries: raise
+                delay = self.backoff_base ** (attempt + 1) * (1 + random.random() * 0.25)
+                with self._cond:
+                    self.metrics["throttled"] += 1
+                    self.metrics["retries"] += 1
+                    self.tokens = 0.0
+                    self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                logging.warning(f"{self.name} throttled, retry in {delay:.1f}s (headroom: {self.headroom()})")
+
+    def headroom(self) -> dict:
+        """目前配額狀態 (供監控 / 日誌使用)"""
+        with self._cond:
+            self._refill(time.monotonic())
+            return {
+                "tokens": round(self.tokens, 1),
+                "capacity": int(self.capacity),
+                "headroom_pct": round(self.tokens / self.capacity * 100, 1) if self.capacity else 0.0,
+                "interactive_waiting": self._waiting[INTERACTIVE],
+                "batch_waiting": self._waiting[BATCH],
+                **{k: round(v, 2) if isinstance(v, float) else v for k, v in self.metrics.items()},
+            }
+
+_schedulers = {}
+_schedulers_guard = threading.Lock()
+
+def get_request_scheduler(source_name: str, hourly_quota: int = FINMIND_HOURLY_QUOTA) -> RequestScheduler:
+    """每個資料來源共用一個排程器 (跨所有 Provider 實例與執行緒)"""
+    with _schedulers_guard:
+        if source_name not in _schedulers:
+            _schedulers[source_name] = RequestScheduler(source_name, hourly_quota)
+        return _schedulers[source_name]
+
 class DataProvider(ABC):
+    source_name = "base"
+    has_chips = False  # 是否提供三大法人籌碼欄位
+    scheduler: Optional[RequestScheduler] = None  # 有配額限制的來源在 __init__ 指定
+
+    def _request(self, fn: Callable, *args, **kwargs) -> Any:
+        """所有對上游 API 的呼叫都經過此處，以便套用配額排程"""
+        if self.scheduler is None: return fn(*args, **kwargs)
+        return self.scheduler.call(fn, *args, **kwargs)
+
     @abstractmethod
     def get_history(self, stock_id: str, days: int = 365) -> pd.DataFrame:
         pass
     @abstractmethod
     def get_fundamentals(self, stock_id: str) -> dict:
         pass
+    def get_history_range(self, stock_id: str, start_date: str, end_date: str) -> pd.DataFrame:
+        """抓取指定日期區間 (含頭尾)，供本地資料庫增量補資料使用"""
+        raise NotImplementedError(f"{self.source_name} 不支援區間查詢")
 
 class FinMindProvider(DataProvider):
+    source_name = "finmind"
+    has_chips = True
+
     def __init__(self):
         try:
             from FinMind.data import DataLoader
             self.loader = DataLoader()
         except ImportError:
             self.loader = None
+        self.scheduler = get_request_scheduler(self.source_name)
 
     def get_history(self, stock_id: str, days: int = 365) -> pd.DataFrame:
+        start = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
+        end = datetime.now().strftime('%Y-%m-%d')
+        return self.get_history_range(stock_id, start, end)
+
+    def get_history_range(self, stock_id: str, start_date: str, end_date: str) -> pd.DataFrame:
         if not self.loader or not stock_id.isdigit(): return pd.DataFrame()
+        start, end = start_date, end_date
         try:
-            start = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
-            end = datetime.now().strftime('%Y-%m-%d')
-            
-            # 1. 抓股價
-            df_price = self.loader.taiwan_stock_daily(stock_id=stock_id, start_date=start, end_date=end)
+            # 股價與籌碼 (三大法人) 兩個資料集同時抓取
+            chip_future = _dataset_pool.submit(contextvars.copy_context().run, self._request, self.loader.taiwan_stock_institutional_investors, stock_id=stock_id, start_date=start, end_date=end)
+            df_price = self._request(self.loader.taiwan_stock_daily, stock_id=stock_id, start_date=start, end_date=end)
             if df_price.empty: return pd.DataFrame()
-            
-            # 2. [新增] 抓籌碼 (三大法人)
-            df_chip = self.loader.taiwan_stock_institutional_investors(stock_id=stock_id, start_date=start, end_date=end)
-            
-            # 整理股價
-            df_price = df_price.rename(columns={'open': 'Open', 'max': 'High', 'min': 'Low', 'close': 'Close', 'Trading_Volume': 'Volume', 'date': 'Date'})
-            df_price['Date'] = pd.to_datetime(df_price['Date'])
-            df_price = df_price.set_index('Date')
-            df_price[['Open', 'High', 'Low', 'Close', 'Volume']] = df_price[['Open', 'High', 'Low', 'Close', 'Volume']].apply(pd.to_numeric, errors='coerce')
-
-            # 整理籌碼 (Pivot Table: 轉成 Foreign_Investor, Investment_Trust, Dealer)
-            if not df_chip.empty:
-                df_chip['name'] = df_chip['name'].map({
-                    'Foreign_Investor': 'Foreign', 
-                    'Investment_Trust': 'Trust', 
-                    'Dealer_Self': 'Dealer',
-                    'Dealer_Hedging': 'Dealer' # 合併自營商
-                })
-                # 買賣超加總
-                df_chip = df_chip.groupby(['date', 'name'])['buy_sell'].sum().unstack(fill_value=0)
-                df_chip.index = pd.to_datetime(df_chip.index)
-                
-                # 合併數據 (Left Join 以股價為主)
-                df_price = df_price.join(df_chip, how='left').fillna(0)
-            else:
-                df_price['Foreign'] = 0
-                df_price['Trust'] = 0
-                df_price['Dealer'] = 0
-
-            return df_price
+            try: df_chip = chip_future.result(timeout=FETCH_TIMEOUT)
+            except Exception: df_chip = pd.DataFrame()
+            return self.format_daily(df_price, df_chip)
 
         except Exception as e:
             # print(f"FinMind Error: {e}")
             return pd.DataFrame()
 
+    @staticmethod
+    def format_daily(df_price: pd.DataFrame, df_chip: pd.DataFrame) -> pd.DataFrame:
+        """FinMind 原始股價 + 三大法人 -> 以日期為索引的 OHLCV + 籌碼 (單一股票)"""
+        # 整理股價
+        df_price = df_price.rename(columns={'open': 'Open', 'max': 'High', 'min': 'Low', 'close': 'Close', 'Trading_Volume': 'Volume', 'date': 'Date'})
+        df_price['Date'] = pd.to_datetime(df_price['Date'])
+        df_price = df_price.set_index('Date')
+        df_price[['Open', 'High', 'Low', 'Close', 'Volume']] = df_price[['Open', 'High', 'Low', 'Close', 'Volume']].apply(pd.to_numeric, errors='coerce')
+
+        # 整理籌碼 (Pivot Table: 轉成 Foreign_Investor, Investment_Trust, Dealer)
+        if df_chip is not None and not df_chip.empty:
+            df_chip = df_chip.copy()
+            df_chip['name'] = df_chip['name'].map({
+                'Foreign_Investor': 'Foreign', 
+                'Investment_Trust': 'Trust', 
+                'Dealer_Self': 'Dealer',
+                'Dealer_Hedging': 'Dealer' # 合併自營商
+            })
+            # 買賣超加總
+            df_chip = df_chip.groupby(['date', 'name'])['buy_sell'].sum().unstack(fill_value=0)
+            df_chip.index = pd.to_datetime(df_chip.index)
+            
+            # 合併數據 (Left Join 以股價為主)
+            df_price = df_price.join(df_chip, how='left').fillna(0)
+        else:
+            df_price['Foreign'] = 0
+            df_price['Trust'] = 0
+            df_price['Dealer'] = 0
+
+        return df_price
+
     def get_fundamentals(self, stock_id: str) -> dict:
         # (保持原樣)
         if not self.loader or not stock_id.isdigit(): return {}
         try:
             start = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
             end = datetime.now().strftime('%Y-%m-%d')
-            df = self.loader.taiwan_stock_per_pbr(stock_id=stock_id, start_date=start, end_date=end)
+            df = self._request(self.loader.taiwan_stock_per_pbr, stock_id=stock_id, start_date=start, end_date=end)
             if not df.empty:
                 latest = df.iloc[-1]
                 return {"pe_ratio": latest.get('PER'), "pb_ratio": latest.get('PBR'), "dividend_yield": latest.get('dividend_yield')}
@@ -80,16 +240,23 @@ class FinMindProvider(DataProvider):
         except: return {}
 
 class YFinanceProvider(DataProvider):
-    # (保持原樣，不需變動)
+    source_name = "yfinance"
+
     def __init__(self): pass
     def _normalize_id(self, stock_id: str) -> str:
         if stock_id.isdigit(): return f"{stock_id}.TW"
         return stock_id
     def get_history(self, stock_id: str, days: int = 365) -> pd.DataFrame:
+        return self._fetch_history(stock_id, period=f"{days}d")
+    def get_history_range(self, stock_id: str, start_date: str, end_date: str) -> pd.DataFrame:
+        # yfinance 的 end 不含當天，往後推一天
+        end = (pd.Timestamp(end_date) + timedelta(days=1)).strftime('%Y-%m-%d')
+        return self._fetch_history(stock_id, start=start_date, end=end)
+    def _fetch_history(self, stock_id: str, **history_kwargs) -> pd.DataFrame:
         target_id = self._normalize_id(stock_id)
         try:
             ticker = yf.Ticker(target_id)
-            df = ticker.history(period=f"{days}d")
+            df = ticker.history(**history_kwargs)
             if df.empty: return pd.DataFrame()
             df.columns = [c.capitalize() for c in df.columns]
             if df.index.tz is not None: df.index = df.index.tz_localize(None)
@@ -115,7 +282,97 @@ class YFinanceProvider(DataProvider):
             }
         except: return {}
 
-def get_data_provider(source_name: str = 'finmind') -> DataProvider:
-    if source_name.lower() == 'finmind': return FinMindProvider()
-    elif source_name.lower() == 'yfinance': return YFinanceProvider()
+class CachedProvider(DataProvider):
+    """
+    本地資料庫包裝層: 先讀 data/market_store，只向上游補抓缺少的日期
+    - 尾端: 從最後一根 K 線往前重疊 TOPUP_OVERLAP_DAYS 天補抓 (籌碼常在盤後才更新)
+    - 頭端: 要求的天數超過已覆蓋範圍時才回補
+    """
+    TOPUP_OVERLAP_DAYS = 3
+
+    def __init__(self, upstream: DataProvider, store=None):
+        from data.market_store import get_market_store
+        self.upstream = upstream
+        self.source_name = upstream.source_name
+        self.has_chips = upstream.has_chips
+        self.store = store or get_market_store(upstream.source_name)
+
+    def get_history(self, stock_id: str, days: int = 365) -> pd.DataFrame:
+        start = (datetime.now() - timedelta(days=days)).date()
+        try:
+            with self.store.lock(stock_id):
+                self._sync(stock_id, start)
+        except Exception as e:
+            logging.warning(f"Market store sync failed ({stock_id}): {e}")
+            return self.upstream.get_history(stock_id, days)
+        return self.store.load(stock_id, start=start)
+
+    def get_history_range(self, stock_id: str, start_date: str, end_date: str) -> pd.DataFrame:
+        return self.upstream.get_history_range(stock_id, start_date, end_date)
+
+    def get_fundamentals(self, stock_id: str) -> dict:
+        return self.upstream.get_fundamentals(stock_id)
+
+    def _sync(self, stock_id: str, start):
+        meta = self.store.load_meta(stock_id)
+        today = datetime.now().date()
+        covered_from = meta.get("covered_from")
+        needs_backfill = covered_from is None or start < datetime.fromisoformat(covered_from).date()
+        cached = self.store.load(stock_id)
+
+        ranges = []
+        if cached.empty:
+            ranges.append((start, today))
+        else:
+            first_date, last_date = cached.index.min().date(), cached.index.max().date()
+            if needs_backfill and start < first_date:
+                ranges.append((start, first_date - timedelta(days=1)))
+            if not self.store.is_fresh(stock_id):
+                ranges.append((last_date - timedelta(days=self.TOPUP_OVERLAP_DAYS), today))
+
+        for range_start, range_end in ranges:
+            if range_start > range_end: continue
+            new_df = self.upstream.get_history_range(stock_id, range_start.strftime('%Y-%m-%d'), range_end.strftime('%Y-%m-%d'))
+            self.store.append(stock_id, new_df)
+
+        fields = {"last_checked": datetime.now().isoformat(timespec='seconds')}
+        if needs_backfill:
+            fields["covered_from"] = start.isoformat()
+        self.store.save_meta(stock_id, **fields)
+
+
+# === 並行抓取 (價格 / 籌碼 / 基本面彼此獨立，不必串行等待) ===
+_fetch_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="data-fetch")
+
+def fetch_concurrently(calls: Dict[str, Union[Callable, Tuple[Callable, float]]], timeout: float = FETCH_TIMEOUT) -> Dict[str, Any]:
+    """
+    同時送出多個互不相依的請求並收集結果
+    calls: {名稱: callable} 或 {名稱: (callable, 該請求逾時秒數)}
+    返回: {名稱: 結果}，逾時或失敗的項目為 None
+    """
+    started = time.monotonic()
+    futures = {}
+    for name, call in calls.items():
+        fn, limit = call if isinstance(call, tuple) else (call, timeout)
+        # 複製 contextvars，讓子執行緒沿用呼叫端的請求通道
+        futures[name] = (_fetch_pool.submit(contextvars.copy_context().run, fn), limit)
+
+    results = {}
+    for name, (future, limit) in futures.items():
+        remaining = max(0.0, limit - (time.monotonic() - started))
+        try:
+            results[name] = future.result(timeout=remaining)
+        except FutureTimeoutError:
+            logging.warning(f"Fetch timeout: {name} (> {limit}s)")
+            results[name] = None
+        except Exception as e:
+            logging.warning(f"Fetch failed: {name} ({e})")
+            results[name] = None
+    return results
+
+
+def get_data_provider(source_name: str = 'finmind', use_store: bool = False) -> DataProvider:
+    if source_name.lower() == 'finmind': provider = FinMindProvider()
+    elif source_name.lower() == 'yfinance': provider = YFinanceProvider()
     else: raise ValueError(f"Unknown source: {source_name}")
+    return CachedProvider(provider) if use_store else provider
@@ -0,0 +1,193 @@
+"""
+本地行情資料庫 (Market Store)
+用途: 每檔股票一個欄式檔案 (Parquet，無 pyarrow 時退回 pickle)，
+      記錄已存到哪一天，讓 Provider 只補抓缺少的日期區間。
+
+目錄結構:
+    data/market_store/<source>/<stock_id>.parquet     OHLCV + 籌碼欄位
+    data/market_store/<source>/<stock_id>.meta.json   覆蓋範圍與最後檢查時間
+"""
+
+import os
+import json
+import threading
+from datetime import datetime, timedelta, time as dtime
+from typing import Optional
+
+import pandas as pd
+
+
+STORE_DIR = "data/market_store"
+PRICE_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+CHIP_COLUMNS = ['Foreign', 'Trust', 'Dealer']
+MARKET_CLOSE_REFRESH = dtime(14, 30)  # 收盤後資料可取得的時間 (台北時間)
+
+try:
+    import pyarrow  # noqa: F401
+    _HAS_PARQUET = True
+except ImportError:
+    _HAS_PARQUET = False
+
+
+def store_key(stock_id: str) -> str:
+    """2330 / 2330.TW / 2330.TWO 共用同一個 key，其他市場保留原代號"""
+    clean_id = stock_id.split('.')[0]
+    if clean_id.isdigit():
+        return clean_id
+    return stock_id.upper().replace('/', '_')
+
+
+class MarketStore:
+    """單一資料來源 (namespace) 的每檔股票日 K 儲存"""
+
+    def __init__(self, source: str, root: str = STORE_DIR):
+        self.source = source
+        self.base_dir = os.path.join(root, source)
+        self._locks = {}
+        self._guard = threading.Lock()
+        os.makedirs(self.base_dir, exist_ok=True)
+
+    # --- 路徑與鎖 ---
+    def _data_path(self, key: str) -> str:
+        ext = "parquet" if _HAS_PARQUET else "pkl"
+        return os.path.join(self.base_dir, f"{key}.{ext}")
+
+    def _meta_path(self, key: str) -> str:
+        return os.path.join(self.base_dir, f"{key}.meta.json")
+
+    def lock(self, stock_id: str) -> threading.Lock:
+        """同一檔股票的讀寫互斥 (不同股票可並行)"""
+        key = store_key(stock_id)
+        with self._guard:
+            if key not in self._locks:
+                self._locks[key] = threading.Lock()
+            return self._locks[key]
+
+    # --- 讀取 ---
+    def load(self, stock_id: str, start: Optional[datetime] = None) -> pd.DataFrame:
+        path = self._data_path(store_key(stock_id))
+        if not os.path.exists(path):
+            return pd.DataFrame()
+        try:
+            df = pd.read_parquet(path) if _HAS_PARQUET else pd.read_pickle(path)
+        except Exception:
+            return pd.DataFrame()
+        if start is not None:
+            df = df[df.index >= pd.Timestamp(start)]
+        return df
+
+    def load_meta(self, stock_id: str) -> dict:
+        path = self._meta_path(store_key(stock_id))
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(path, "r") as f:
+                return json.load(f)
+        except Exception:
+            return {}
+
+    def save_meta(self, stock_id: str, **fields):
+        key = store_key(stock_id)
+        meta = self.load_meta(key)
+        meta.update(fields)
+        tmp_path = self._meta_path(key) + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f, indent=2)
+        os.replace(tmp_path, self._meta_path(key))
+
+    def last_date(self, stock_id: str) -> Optional[pd.Timestamp]:
+        df = self.load(stock_id)
+        return df.index.max() if not df.empty else None
+
+    # --- 寫入 ---
+    def append(self, stock_id: str, new_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        合併新資料: 同一天以新資料為準 (例如盤後才補上的籌碼)，
+        價格與籌碼欄位一起寫回，回傳合併後的完整資料
+        """
+        if new_df is None or new_df.empty:
+            return self.load(stock_id)
+
+        key = store_key(stock_id)
+        new_df = new_df.copy()
+        new_df.index = pd.to_datetime(new_df.index)
+        new_df.index.name = 'Date'
+        for col in CHIP_COLUMNS:
+            if col not in new_df.columns:
+                new_df[col] = 0
+
+        old_df = self.load(key)
+        merged = pd.concat([old_df, new_df]) if not old_df.empty else new_df
+        merged = merged[~merged.index.duplicated(keep='last')].sort_index()
+        merged[CHIP_COLUMNS] = merged[CHIP_COLUMNS].fillna(0)
+
+        path = self._data_path(key)
+        tmp_path = path + ".tmp"
+        if _HAS_PARQUET:
+            merged.to_parquet(tmp_path)
+        else:
+            merged.to_pickle(tmp_path)
+        os.replace(tmp_path, path)
+        return merged
+
+    # --- 全市場橫斷面快照 (例如每日 PER/PBR) ---
+    def _snapshot_path(self, name: str, date: str) -> str:
+        ext = "parquet" if _HAS_PARQUET else "pkl"
+        return os.path.join(self.base_dir, "snapshots", name, f"{date}.{ext}")
+
+    def save_snapshot(self, name: str, date: str, df: pd.DataFrame):
+        path = self._snapshot_path(name, date)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        if _HAS_PARQUET:
+            df.to_parquet(tmp_path)
+        else:
+            df.to_pickle(tmp_path)
+        os.replace(tmp_path, path)
+
+    def list_snapshots(self, name: str) -> list:
+        """回傳已存的快照日期 (由舊到新)"""
+        snap_dir = os.path.join(self.base_dir, "snapshots", name)
+        if not os.path.isdir(snap_dir):
+            return []
+        return sorted(f.rsplit('.', 1)[0] for f in os.listdir(snap_dir) if not f.endswith('.tmp'))
+
+    def load_snapshot(self, name: str, date: Optional[str] = None) -> pd.DataFrame:
+        """讀取指定日期的快照，未指定則讀最新一份"""
+        if date is None:
+            dates = self.list_snapshots(name)
+            if not dates:
+                return pd.DataFrame()
+            date = dates[-1]
+        path = self._snapshot_path(name, date)
+        if not os.path.exists(path):
+            return pd.DataFrame()
+        try:
+            return pd.read_parquet(path) if _HAS_PARQUET else pd.read_pickle(path)
+        except Exception:
+            return pd.DataFrame()
+
+    # --- 增量判斷 ---
+    def is_fresh(self, stock_id: str, now: Optional[datetime] = None) -> bool:
+        """最後一次檢查是否已晚於最近一次收盤 (收盤後才會有新 K 線)"""
+        last_checked = self.load_meta(stock_id).get("last_checked")
+        if not last_checked:
+            return False
+        now = now or datetime.now()
+        latest_close = datetime.combine(now.date(), MARKET_CLOSE_REFRESH)
+        if now < latest_close:
+            latest_close -= timedelta(days=1)
+        return datetime.fromisoformat(last_checked) >= latest_close
+
+
+# 每個 source 一個實例，跨執行緒共用鎖
+_stores = {}
+_stores_guard = threading.Lock()
+
+
+def get_market_store(source: str) -> MarketStore:
+    """获取全局行情資料庫實例"""
+    with _stores_guard:
+        if source not in _stores:
+            _stores[source] = MarketStore(source)
+        return _stores[source]
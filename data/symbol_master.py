@@ -0,0 +1,185 @@
+"""
+股票代號主檔 (Symbol Master)
+用途: 代號 ↔ 中文名稱 ↔ 市場後綴 (.TW / .TWO) ↔ 產業別 的單一行程內索引
+- 來源為 FinMind taiwan_stock_info()，落地到 data/market_store/symbol_master.json
+- 超過 TTL 才重新下載；下載失敗時沿用舊檔
+- 中文名稱以字元 / 二元組 (bigram) 倒排索引支援模糊查詢
+"""
+
+import os
+import json
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from utils.logger import log_info, log_warn
+
+
+SYMBOL_FILE = "data/market_store/symbol_master.json"
+SYMBOL_TTL_HOURS = 24
+MARKET_SUFFIX = {"twse": ".TW", "tpex": ".TWO", "emerging": ".TWO"}
+
+
+def _ngrams(text: str) -> set:
+    """單字元 + 二元組，查詢字串長度 1 時用單字元，其餘用二元組"""
+    grams = set(text)
+    grams.update(text[i:i + 2] for i in range(len(text) - 1))
+    return grams
+
+
+class SymbolMaster:
+    """代號主檔與名稱索引"""
+
+    def __init__(self, path: str = SYMBOL_FILE, ttl_hours: int = SYMBOL_TTL_HOURS):
+        self.path = path
+        self.ttl = timedelta(hours=ttl_hours)
+        self.lock = threading.Lock()
+        self.loaded_at = None
+        self.records: Dict[str, Dict] = {}
+        self.name_to_id: Dict[str, str] = {}
+        self.gram_index: Dict[str, set] = {}
+
+    # --- 載入 / 更新 ---
+    def _ensure_loaded(self):
+        if self.loaded_at and datetime.now() - self.loaded_at < self.ttl:
+            return
+        with self.lock:
+            if self.loaded_at and datetime.now() - self.loaded_at < self.ttl:
+                return
+            cached = self._read_file()
+            fetched_at = datetime.fromisoformat(cached["fetched_at"]) if cached else None
+            if cached and datetime.now() - fetched_at < self.ttl:
+                self._build(cached["records"], fetched_at)
+                return
+            records = self._download()
+            if records:
+                self._write_file(records)
+                self._build(records, datetime.now())
+            elif cached:
+                log_warn("⚠️ 代號主檔更新失敗，沿用舊資料")
+                self._build(cached["records"], datetime.now())
+            else:
+                # 沒有任何資料時 5 分鐘後再重試，避免每次查詢都重新下載
+                self._build([], datetime.now() - self.ttl + timedelta(minutes=5))
+
+    def refresh(self):
+        """強制重新下載"""
+        with self.lock:
+            self.loaded_at = None
+            records = self._download()
+            if records:
+                self._write_file(records)
+                self._build(records, datetime.now())
+
+    def _download(self) -> List[Dict]:
+        try:
+            from data.data_loader import FinMindProvider
+            provider = FinMindProvider()
+            df = provider._request(provider.loader.taiwan_stock_info)
+        except Exception as e:
+            log_warn(f"⚠️ 無法下載代號主檔: {e}")
+            return []
+        df = df.drop_duplicates('stock_id', keep='first')
+        records = []
+        for stock_id, name, market, industry in zip(df['stock_id'], df['stock_name'], df['type'], df['industry_category']):
+            records.append({
+                "stock_id": str(stock_id),
+                "name": str(name).strip(),
+                "market": market,
+                "suffix": MARKET_SUFFIX.get(market, ".TW"),
+                "industry": industry,
+            })
+        log_info(f"✅ 代號主檔已更新: {len(records)} 檔")
+        return records
+
+    def _read_file(self) -> Optional[Dict]:
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception:
+            return None
+
+    def _write_file(self, records: List[Dict]):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"fetched_at": datetime.now().isoformat(), "records": records}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def _build(self, records: List[Dict], loaded_at: datetime):
+        by_id, by_name, grams = {}, {}, {}
+        for rec in records:
+            by_id[rec["stock_id"]] = rec
+            by_name.setdefault(rec["name"], rec["stock_id"])
+            for g in _ngrams(rec["name"]):
+                grams.setdefault(g, set()).add(rec["stock_id"])
+        self.records, self.name_to_id, self.gram_index = by_id, by_name, grams
+        self.loaded_at = loaded_at
+
+    # --- 查詢 ---
+    def get(self, stock_id: str) -> Optional[Dict]:
+        self._ensure_loaded()
+        return self.records.get(stock_id.split('.')[0])
+
+    def name(self, stock_id: str) -> Optional[str]:
+        rec = self.get(stock_id)
+        return rec["name"] if rec else None
+
+    def ticker(self, stock_id: str) -> Optional[str]:
+        """2330 -> 2330.TW, 3491 -> 3491.TWO"""
+        rec = self.get(stock_id)
+        return f"{rec['stock_id']}{rec['suffix']}" if rec else None
+
+    def industry(self, stock_id: str) -> Optional[str]:
+        rec = self.get(stock_id)
+        return rec["industry"] if rec else None
+
+    def name_map(self) -> Dict[str, str]:
+        """名稱 -> 代號"""
+        self._ensure_loaded()
+        return dict(self.name_to_id)
+
+    def search(self, query: str, limit: int = 10) -> List[Dict]:
+        """
+        模糊查詢中文名稱: 先用倒排索引取交集，再確認子字串
+        排序: 完全相同 > 開頭相同 > 名稱較短
+        """
+        self._ensure_loaded()
+        query = query.strip()
+        if not query:
+            return []
+        grams = {query} if len(query) <= 2 else {query[i:i + 2] for i in range(len(query) - 1)}
+        postings = [self.gram_index.get(g, set()) for g in grams]
+        candidates = set.intersection(*postings) if postings else set()
+        matches = [self.records[sid] for sid in candidates if query in self.records[sid]["name"]]
+        matches.sort(key=lambda r: (r["name"] != query, not r["name"].startswith(query), len(r["name"]), r["stock_id"]))
+        return matches[:limit]
+
+    def resolve(self, query: str) -> Optional[Tuple[str, str]]:
+        """代號或名稱 -> (帶後綴代號, 中文名稱)，找不到回傳 None"""
+        self._ensure_loaded()
+        raw = query.strip().upper()
+        clean_id = raw.split('.')[0]
+        if clean_id in self.records:
+            rec = self.records[clean_id]
+            return f"{rec['stock_id']}{rec['suffix']}", rec["name"]
+        found = self.search(query.strip(), limit=1)
+        if found:
+            return f"{found[0]['stock_id']}{found[0]['suffix']}", found[0]["name"]
+        return None
+
+
+# 全局实例
+_master = None
+_master_guard = threading.Lock()
+
+
+def get_symbol_master() -> SymbolMaster:
+    """获取全局代號主檔實例"""
+    global _master
+    with _master_guard:
+        if _master is None:
+            _master = SymbolMaster()
+        return _master
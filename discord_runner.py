@@ -15,24 +15,23 @@ sys.path.insert(0, PROJECT_ROOT)
 load_dotenv(dotenv_path=Path(PROJECT_ROOT) / '.env', override=True)
 
 from main import analyze_single_target, generate_moltbot_prompt, get_stock_name_zh, TARGET_STOCKS
+from data.symbol_master import get_symbol_master
 from ai_runner import generate_insight
+from ingest_runner import run_bulk_ingestion
 from utils.logger import log_info, log_error
+from utils.single_flight import get_single_flight, flight_key
 from utils.history_recorder import record_user_query
 from utils.quota_manager import check_quota_status, deduct_quota, admin_add_quota
 from utils.user_analytics import create_ranking_embed
 from utils.period_backtest import load_period_results, get_predefined_periods
 
-# Load stock map
+# Load stock map (名稱 -> 代號，由代號主檔提供)
 STOCK_MAP = {}
 def load_stock_map():
     global STOCK_MAP
     try:
-        print("📥 Loading stock list from FinMind...")
-        from FinMind.data import DataLoader
-        dl = DataLoader()
-        df = dl.taiwan_stock_info()
-        for index, row in df.iterrows():
-            STOCK_MAP[row['stock_name']] = row['stock_id']
+        print("📥 Loading stock list from symbol master...")
+        STOCK_MAP = get_symbol_master().name_map()
         print(f"✅ Stock map loaded: {len(STOCK_MAP)} entries.")
     except Exception as e:
         print(f"❌ Failed to load stock map: {e}")
@@ -79,25 +78,30 @@ class QuantBot(commands.Bot):
         await asyncio.to_thread(load_stock_map)
         if not self.daily_scan_task.is_running():
             self.daily_scan_task.start()
+        if not self.nightly_ingest_task.is_running():
+            self.nightly_ingest_task.start()
 
     @tasks.loop(time=time(hour=6, minute=0, tzinfo=timezone.utc))
     async def daily_scan_task(self):
         if not self.target_channel_id: return
         pass 
 
+    # 台北時間 17:30 (收盤且法人資料公布後) 全市場批次匯入
+    @tasks.loop(time=time(hour=9, minute=30, tzinfo=timezone.utc))
+    async def nightly_ingest_task(self):
+        try:
+            summary = await asyncio.to_thread(run_bulk_ingestion, 1)
+            log_info(f"📦 盤後批次匯入: {summary}")
+        except Exception as e:
+            log_error(f"盤後批次匯入失敗: {e}")
+
 bot = QuantBot()
 
 def resolve_ticker_info(ticker_input):
     raw = ticker_input.strip().upper()
-    if raw.isdigit():
-        candidates = [f"{raw}.TW", f"{raw}.TWO"]
-        for c in candidates:
-            name = get_stock_name_zh(c)
-            if name != c: return c, name
-        return candidates[0], candidates[0]
-    if raw in STOCK_MAP: return f"{STOCK_MAP[raw]}.TW", raw
-    for name, stock_id in STOCK_MAP.items():
-        if raw in name: return f"{stock_id}.TW", name
+    resolved = get_symbol_master().resolve(ticker_input)
+    if resolved: return resolved
+    if raw.isdigit(): return f"{raw}.TW", f"{raw}.TW"
     return raw, raw
 
 @bot.command(name="analyze", aliases=["a"])
@@ -150,7 +154,9 @@ async def analyze_stock(ctx, ticker: str = None):
             record_user_query(ctx.author.name, data['meta']['ticker'], data['meta']['name'], dec['action'], dec['final_confidence'], roi)
 
             prompt = generate_moltbot_prompt(data, is_single=True)
-            ai_response = await asyncio.to_thread(generate_insight, prompt)
+            ai_response = await asyncio.to_thread(
+                get_single_flight().do, flight_key(data['meta']['ticker'], "insight"), generate_insight, prompt
+            )
             
             final_name = data['meta']['name']
             
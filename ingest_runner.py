@@ -0,0 +1,171 @@
+"""
+全市場盤後批次匯入 (Bulk Daily Ingestion)
+用途: 收盤後以「每個資料集每天一次」的方式抓取全市場日 K、三大法人與 PER/PBR，
+      寫入 data/market_store，讓 CachedProvider 之後直接讀本地資料。
+
+用法:
+    python ingest_runner.py                  # 匯入今天 (非交易日則無資料)
+    python ingest_runner.py --days 5         # 回補最近 5 個工作日
+    python ingest_runner.py --with-yfinance  # 同時以 yf.download 批次更新 yfinance 資料庫
+"""
+
+import os
+import sys
+import argparse
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from data.data_loader import FinMindProvider, request_lane, BATCH
+from data.market_store import get_market_store
+from utils.logger import log_info, log_warn, log_error
+
+PER_PBR_SNAPSHOT = "per_pbr"
+YF_BATCH_SIZE = 200  # yf.download 單次代號數
+
+
+def recent_weekdays(days: int = 1, end: datetime = None) -> List[str]:
+    """最近 N 個工作日 (由舊到新)"""
+    end = end or datetime.now()
+    dates = []
+    cursor = end
+    while len(dates) < days:
+        if cursor.weekday() < 5:
+            dates.append(cursor.strftime('%Y-%m-%d'))
+        cursor -= timedelta(days=1)
+    return dates[::-1]
+
+
+def fetch_market_day(provider: FinMindProvider, date: str):
+    """
+    單日全市場資料 (不帶 stock_id 即為全市場)，經由 Provider 的配額排程發出
+    返回: (股價, 三大法人, PER/PBR) 三個原始 DataFrame
+    """
+    loader = provider.loader
+    df_price = provider._request(loader.taiwan_stock_daily, start_date=date, end_date=date)
+    df_chip = provider._request(loader.taiwan_stock_institutional_investors, start_date=date, end_date=date)
+    df_per = provider._request(loader.taiwan_stock_per_pbr, start_date=date, end_date=date)
+    return df_price, df_chip, df_per
+
+
+def ingest_finmind(dates: List[str]) -> Dict:
+    """把多個交易日的全市場資料依股票分組後，每檔只寫入一次"""
+    provider = FinMindProvider()
+    if provider.loader is None:
+        raise RuntimeError("FinMind 未安裝")
+
+    store = get_market_store("finmind")
+    prices, chips = [], []
+    chip_dates = set()
+
+    for date in dates:
+        try:
+            df_price, df_chip, df_per = fetch_market_day(provider, date)
+        except Exception as e:
+            log_error(f"❌ 全市場資料抓取失敗 {date}: {e}")
+            continue
+        if df_price is None or df_price.empty:
+            log_info(f"📭 {date} 無交易資料 (假日或尚未公布)")
+            continue
+        prices.append(df_price)
+        if df_chip is not None and not df_chip.empty:
+            chips.append(df_chip)
+            chip_dates.add(date)
+        if df_per is not None and not df_per.empty:
+            store.save_snapshot(PER_PBR_SNAPSHOT, date, df_per.reset_index(drop=True))
+        log_info(f"📥 {date}: 股價 {len(df_price)} 筆 / 法人 {0 if df_chip is None else len(df_chip)} 筆 / PER {0 if df_per is None else len(df_per)} 筆")
+
+    if not prices:
+        return {"dates": [], "tickers": 0}
+
+    all_price = pd.concat(prices, ignore_index=True)
+    all_chip = pd.concat(chips, ignore_index=True) if chips else pd.DataFrame()
+    chip_groups = dict(tuple(all_chip.groupby('stock_id'))) if not all_chip.empty else {}
+    checked_at = datetime.now().isoformat(timespec='seconds')
+    chips_complete = chip_dates.issuperset(all_price['date'].unique())
+
+    count = 0
+    for stock_id, df_price in all_price.groupby('stock_id'):
+        if not str(stock_id).isdigit():
+            continue
+        try:
+            daily = FinMindProvider.format_daily(df_price, chip_groups.get(stock_id))
+            with store.lock(stock_id):
+                store.append(stock_id, daily)
+                # 籌碼齊全才標記為已更新，否則讓互動查詢時再補抓
+                if chips_complete:
+                    store.save_meta(stock_id, last_checked=checked_at)
+            count += 1
+        except Exception as e:
+            log_warn(f"⚠️ 寫入失敗 {stock_id}: {e}")
+
+    log_info(f"✅ FinMind 批次匯入完成: {count} 檔, 日期 {sorted(all_price['date'].unique())}")
+    return {"dates": sorted(all_price['date'].unique()), "tickers": count}
+
+
+def load_yfinance_universe() -> List[str]:
+    """上市 .TW / 上櫃 .TWO 代號清單"""
+    provider = FinMindProvider()
+    info = provider._request(provider.loader.taiwan_stock_info)
+    info = info[info['stock_id'].str.isdigit()].drop_duplicates('stock_id')
+    suffix = info['type'].map({'twse': '.TW', 'tpex': '.TWO'})
+    return sorted((info['stock_id'] + suffix).dropna().unique())
+
+
+def ingest_yfinance(tickers: List[str], start: str, end: str) -> Dict:
+    """yf.download 一次抓多檔，分批寫入 yfinance 資料庫"""
+    import yfinance as yf
+
+    store = get_market_store("yfinance")
+    end_exclusive = (pd.Timestamp(end) + timedelta(days=1)).strftime('%Y-%m-%d')
+    checked_at = datetime.now().isoformat(timespec='seconds')
+    count = 0
+
+    for i in range(0, len(tickers), YF_BATCH_SIZE):
+        batch = tickers[i:i + YF_BATCH_SIZE]
+        try:
+            raw = yf.download(batch, start=start, end=end_exclusive, group_by='ticker',
+                              auto_adjust=True, threads=True, progress=False)
+        except Exception as e:
+            log_error(f"❌ yfinance 批次下載失敗 ({batch[0]}...): {e}")
+            continue
+        if raw is None or raw.empty:
+            continue
+        for ticker in batch:
+            if ticker not in raw.columns.get_level_values(0):
+                continue
+            df = raw[ticker].dropna(how='all')
+            if df.empty:
+                continue
+            if df.index.tz is not None: df.index = df.index.tz_localize(None)
+            df = df[['Open', 'High', 'Low', 'Close', 'Volume']].assign(Foreign=0, Trust=0, Dealer=0)
+            with store.lock(ticker):
+                store.append(ticker, df)
+                store.save_meta(ticker, last_checked=checked_at)
+            count += 1
+
+    log_info(f"✅ yfinance 批次匯入完成: {count} 檔")
+    return {"tickers": count}
+
+
+def run_bulk_ingestion(days: int = 1, include_yfinance: bool = False) -> Dict:
+    """盤後排程進入點 (走批次通道，不搶互動查詢的配額)"""
+    dates = recent_weekdays(days)
+    with request_lane(BATCH):
+        summary = {"finmind": ingest_finmind(dates)}
+        if include_yfinance:
+            try:
+                summary["yfinance"] = ingest_yfinance(load_yfinance_universe(), dates[0], dates[-1])
+            except Exception as e:
+                log_error(f"❌ yfinance 批次匯入失敗: {e}")
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="全市場盤後批次匯入")
+    parser.add_argument("--days", type=int, default=1, help="回補最近 N 個工作日")
+    parser.add_argument("--with-yfinance", action="store_true", help="同時更新 yfinance 資料庫")
+    args = parser.parse_args()
+    print(run_bulk_ingestion(args.days, args.with_yfinance))
@@ -7,7 +7,8 @@ import numpy as np
 from datetime import datetime
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
-from data.data_loader import get_data_provider
+from data.data_loader import get_data_provider, fetch_concurrently
+from data.symbol_master import get_symbol_master
 from strategies.indicators.ma_crossover import MACrossoverStrategy
 from strategies.indicators.valuation_strategy import ValuationStrategy
 from strategies.indicators.bollinger_strategy import BollingerStrategy
@@ -16,6 +17,7 @@ from strategies.price_action.pullback_strategy import PullbackStrategy
 from utils.plotter import generate_stock_chart
 from optimizer_runner import find_best_params
 from utils.logger import log_info, log_warn, log_error
+from utils.single_flight import get_single_flight, flight_key
 from strategies.ml_models import create_predictor
 
 # ... (Helper functions 保持原樣) ...
@@ -30,41 +32,54 @@ def get_stock_name_zh(stock_id: str) -> str:
     clean_id = stock_id.split('.')[0]
     if not clean_id.isdigit(): return stock_id
     try:
-        from FinMind.data import DataLoader
-        dl = DataLoader()
-        df = dl.taiwan_stock_info()
-        row = df[df['stock_id'] == clean_id]
-        if not row.empty: return row.iloc[0]['stock_name']
+        name = get_symbol_master().name(clean_id)
+        if name: return name
     except: pass
     return clean_id
 
 def fetch_stock_data_smart(stock_id: str):
+    # 同一檔股票的並發請求只抓一次，其餘等待共用結果
+    return get_single_flight().do(flight_key(stock_id, "fetch"), _fetch_stock_data_smart, stock_id)
+
+def _fetch_stock_data_smart(stock_id: str):
     log_info(f"正在獲取數據: {stock_id} ...")
     clean_id = stock_id.split('.')[0]
     candidates = [f"{clean_id}.TWO", f"{clean_id}.TW"] if "TWO" in stock_id else [f"{clean_id}.TW", f"{clean_id}.TWO"]
     if not clean_id.isdigit(): candidates = [stock_id]
+    else:
+        # 主檔已知上市/上櫃時不必猜後綴
+        known_ticker = get_symbol_master().ticker(clean_id)
+        if known_ticker: candidates = [known_ticker]
+
+    provider = get_data_provider(PRIMARY_SOURCE, use_store=True)
+    yf_provider = get_data_provider(FALLBACK_SOURCE, use_store=True)
+
+    # 價格、基本面與備援來源同時送出，總耗時取決於最慢的一個請求
+    calls = {
+        "history": lambda: provider.get_history(clean_id),
+        "fundamentals": lambda: provider.get_fundamentals(clean_id),
+    }
+    for cand in candidates:
+        calls[f"yf_history:{cand}"] = lambda c=cand: yf_provider.get_history(c)
+        if clean_id.isdigit():
+            calls[f"yf_fundamentals:{cand}"] = lambda c=cand: yf_provider.get_fundamentals(c)
+    results = fetch_concurrently(calls)
+
     last_error = "未知"
+    primary_df = results.get("history")
     for current_id in candidates:
-        provider = get_data_provider(PRIMARY_SOURCE)
         try:
-            df = provider.get_history(clean_id)
-            if df.empty or len(df) < 60:
-                yf_provider = get_data_provider(FALLBACK_SOURCE)
-                df = yf_provider.get_history(current_id)
-            if df.empty: last_error = "查無數據"; continue
+            df = primary_df
+            if df is None or df.empty or len(df) < 60:
+                df = results.get(f"yf_history:{current_id}")
+            if df is None or df.empty: last_error = "查無數據"; continue
             if len(df) < 60: last_error = "數據不足"; continue
-            fundamentals = {}
-            try: fundamentals = provider.get_fundamentals(clean_id)
-            except: pass
+            fundamentals = dict(results.get("fundamentals") or {})
             if (not fundamentals or not fundamentals.get("pe_ratio")) and clean_id.isdigit():
-                try:
-                    yf_provider = get_data_provider(FALLBACK_SOURCE)
-                    yf_funds = yf_provider.get_fundamentals(current_id)
-                    if yf_funds and (yf_funds.get("pe_ratio") or yf_funds.get("market_cap")):
-                        if not fundamentals: fundamentals = {}
-                        for k, v in yf_funds.items():
-                            if k not in fundamentals or fundamentals[k] is None: fundamentals[k] = v
-                except: pass
+                yf_funds = results.get(f"yf_fundamentals:{current_id}")
+                if yf_funds and (yf_funds.get("pe_ratio") or yf_funds.get("market_cap")):
+                    for k, v in yf_funds.items():
+                        if k not in fundamentals or fundamentals[k] is None: fundamentals[k] = v
             log_info(f"數據獲取成功: {current_id}")
             return {"status": "success", "source": "Hybrid", "df": df, "fundamentals": fundamentals, "ticker": current_id}
         except Exception as e: last_error = str(e); continue
@@ -72,9 +87,8 @@ def fetch_stock_data_smart(stock_id: str):
 
 def analyze_chip(df):
     if 'Foreign' not in df.columns: return {"score": 0, "status": "Neutral", "reason": "無籌碼"}
-    df['Foreign'] = df['Foreign'].fillna(0)
-    recent = df.tail(5)
-    foreign_sum = recent['Foreign'].sum()
+    # 不回寫 df: 合併請求時多個執行緒共用同一份 DataFrame
+    foreign_sum = df['Foreign'].fillna(0).tail(5).sum()
     score = 0; status = "Neutral"; reasons = []
     if foreign_sum > 1000: score+=1; reasons.append(f"外資累積買超 {int(foreign_sum/1000)}k"); status="Bullish"
     elif foreign_sum < -1000: score-=1; reasons.append(f"外資累積賣超 {int(abs(foreign_sum)/1000)}k"); status="Bearish"
@@ -286,6 +300,13 @@ def calculate_final_decision(tech_res, fund_res, chip_res, bollinger_res, kd_res
     }
 
 def analyze_single_target(stock_id: str, run_optimization_if_missing: bool = False):
+    # 熱門股同時被多人查詢時只跑一次 (抓資料 / 錦標賽 / 畫圖)，結果共用
+    return get_single_flight().do(
+        flight_key(stock_id, "analyze", run_optimization_if_missing),
+        _analyze_single_target, stock_id, run_optimization_if_missing
+    )
+
+def _analyze_single_target(stock_id: str, run_optimization_if_missing: bool = False):
     clean_id = stock_id.split('.')[0]
     backtest_info = None; config = {}
     if os.path.exists(CONFIG_FILE):
@@ -296,7 +317,7 @@ def analyze_single_target(stock_id: str, run_optimization_if_missing: bool = Fal
     if not backtest_info and run_optimization_if_missing:
         log_info(f"啟動 V10.1 策略錦標賽 (UI Polish): {clean_id}")
         target_input = f"{clean_id}.TW"
-        new_params = find_best_params(target_input)
+        new_params = get_single_flight().do(flight_key(clean_id, "optimize"), find_best_params, target_input)
         if new_params:
             config[clean_id] = new_params
             os.makedirs("data", exist_ok=True)
@@ -49,14 +49,14 @@ def get_data_hybrid(ticker):
     # (保持原樣)
     clean_id = ticker.split('.')[0]
     candidates = [f"{clean_id}.TW", f"{clean_id}.TWO"] if clean_id.isdigit() else [ticker]
-    provider = get_data_provider("yfinance")
+    provider = get_data_provider("yfinance", use_store=True)
     for cand in candidates:
         try:
             df = provider.get_history(cand, days=1095)
             if not df.empty and len(df) > 200: return df
         except: continue
     if clean_id.isdigit():
-        try: return get_data_provider("finmind").get_history(clean_id, days=1095)
+        try: return get_data_provider("finmind", use_store=True).get_history(clean_id, days=1095)
         except: pass
     return pd.DataFrame()
 
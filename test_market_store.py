@@ -0,0 +1,75 @@
+"""
+本地行情資料庫 (MarketStore / CachedProvider) 驗證
+使用假的上游 Provider，不需要網路
+"""
+
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from data.data_loader import DataProvider, CachedProvider
+from data.market_store import MarketStore
+
+
+class FakeProvider(DataProvider):
+    """依日期區間產生工作日 K 線，並記錄每次被呼叫的區間"""
+    source_name = "fake"
+    has_chips = True
+
+    def __init__(self):
+        self.calls = []
+
+    def get_history(self, stock_id, days=365):
+        end = datetime.now().date()
+        return self.get_history_range(stock_id, str(end - timedelta(days=days)), str(end))
+
+    def get_history_range(self, stock_id, start_date, end_date):
+        self.calls.append((start_date, end_date))
+        idx = pd.bdate_range(start_date, end_date, name='Date')
+        return pd.DataFrame({
+            'Open': 100.0, 'High': 101.0, 'Low': 99.0, 'Close': 100.5, 'Volume': 1000,
+            'Foreign': 10.0, 'Trust': 0.0, 'Dealer': 0.0,
+        }, index=idx)
+
+    def get_fundamentals(self, stock_id):
+        return {}
+
+
+def test_cached_provider_incremental(tmp_path):
+    """第二次查詢同一檔股票只讀本地，要求更長區間時只回補頭端"""
+    upstream = FakeProvider()
+    provider = CachedProvider(upstream, store=MarketStore("fake", root=str(tmp_path)))
+
+    df = provider.get_history("2330", days=100)
+    assert not df.empty
+    assert len(upstream.calls) == 1
+
+    df_again = provider.get_history("2330.TW", days=100)
+    assert len(upstream.calls) == 1
+    assert len(df_again) == len(df)
+
+    df_long = provider.get_history("2330", days=300)
+    assert len(upstream.calls) == 2
+    backfill_start, backfill_end = upstream.calls[-1]
+    assert pd.Timestamp(backfill_end) < df.index.min()
+    assert len(df_long) > len(df)
+    assert not df_long.index.duplicated().any()
+
+
+def test_store_append_overwrites_same_day(tmp_path):
+    """同一天的新資料覆蓋舊資料 (盤後補上的籌碼)"""
+    store = MarketStore("fake", root=str(tmp_path))
+    idx = pd.to_datetime(["2026-01-05", "2026-01-06"])
+    base = pd.DataFrame({'Open': 1.0, 'High': 1.0, 'Low': 1.0, 'Close': 1.0, 'Volume': 1, 'Foreign': 0.0}, index=idx)
+    store.append("2330", base)
+
+    update = base.iloc[[-1]].copy()
+    update['Foreign'] = 500.0
+    merged = store.append("2330", update)
+
+    assert len(merged) == 2
+    assert merged.loc["2026-01-06", 'Foreign'] == 500.0
+    assert merged.loc["2026-01-05", 'Trust'] == 0
@@ -0,0 +1,37 @@
+"""
+FinMind 配額排程 (RequestScheduler) 驗證
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from data.data_loader import RequestScheduler, request_lane, INTERACTIVE, BATCH
+
+
+def test_batch_lane_keeps_reserve_for_interactive():
+    # 容量 10、保留 20% -> 批次最多用到剩 3 個 token 前
+    scheduler = RequestScheduler("test", hourly_quota=10, batch_reserve_ratio=0.2)
+    taken = 0
+    while scheduler.acquire(BATCH, timeout=0.01):
+        taken += 1
+    assert taken == 8
+    # 互動請求仍可使用保留額度
+    assert scheduler.acquire(INTERACTIVE, timeout=0.01)
+    assert scheduler.headroom()["requests"] == 9
+
+
+def test_throttled_call_backs_off_and_retries():
+    scheduler = RequestScheduler("test", hourly_quota=36000, backoff_base=0.01)
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise Exception("FinMind API unexpected response: Requests reach the upper limit")
+        return "ok"
+
+    with request_lane(INTERACTIVE):
+        assert scheduler.call(flaky) == "ok"
+    assert len(attempts) == 2
+    assert scheduler.headroom()["throttled"] == 1
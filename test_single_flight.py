@@ -0,0 +1,54 @@
+"""
+單飛請求合併 (SingleFlight) 驗證
+"""
+
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from utils.single_flight import SingleFlight, flight_key
+
+
+def test_concurrent_callers_share_one_execution():
+    flights = SingleFlight()
+    calls = []
+
+    def slow_analysis():
+        calls.append(1)
+        time.sleep(0.2)
+        return {"ticker": "2330"}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flights.do(flight_key("2330.TW", "analyze"), slow_analysis))) for _ in range(5)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+
+    assert len(calls) == 1
+    assert len(results) == 5 and all(r is results[0] for r in results)
+    assert flights.in_flight() == 0
+
+    # 完成後不快取，下一次呼叫重新執行
+    flights.do(flight_key("2330", "analyze"), slow_analysis)
+    assert len(calls) == 2
+
+
+def test_error_propagates_to_waiters():
+    flights = SingleFlight()
+    errors = []
+
+    def failing():
+        time.sleep(0.1)
+        raise RuntimeError("upstream down")
+
+    def worker():
+        try:
+            flights.do("k", failing)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=worker) for _ in range(3)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    assert errors == ["upstream down"] * 3
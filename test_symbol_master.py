@@ -0,0 +1,41 @@
+"""
+代號主檔 (SymbolMaster) 驗證: 以固定資料建立索引，不需要網路
+"""
+
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from data.symbol_master import SymbolMaster
+
+
+RECORDS = [
+    {"stock_id": "2330", "name": "台積電", "market": "twse", "suffix": ".TW", "industry": "半導體業"},
+    {"stock_id": "2492", "name": "華新科", "market": "twse", "suffix": ".TW", "industry": "電子零組件業"},
+    {"stock_id": "1605", "name": "華新", "market": "twse", "suffix": ".TW", "industry": "電器電纜"},
+    {"stock_id": "3491", "name": "昇達科", "market": "tpex", "suffix": ".TWO", "industry": "通信網路業"},
+]
+
+
+def _master(tmp_path):
+    master = SymbolMaster(path=str(tmp_path / "symbol_master.json"))
+    master._build(RECORDS, datetime.now())
+    return master
+
+
+def test_resolve_by_id_uses_market_suffix(tmp_path):
+    master = _master(tmp_path)
+    assert master.resolve("3491") == ("3491.TWO", "昇達科")
+    assert master.resolve("2330.TW") == ("2330.TW", "台積電")
+    assert master.ticker("3491") == "3491.TWO"
+    assert master.industry("2330") == "半導體業"
+
+
+def test_fuzzy_name_search(tmp_path):
+    master = _master(tmp_path)
+    # 完全相同優先於較長的名稱
+    assert master.resolve("華新") == ("1605.TW", "華新")
+    assert [r["stock_id"] for r in master.search("華新")] == ["1605", "2492"]
+    assert master.resolve("積電") == ("2330.TW", "台積電")
+    assert master.resolve("不存在的公司") is None
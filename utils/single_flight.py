@@ -0,0 +1,74 @@
+"""
+單飛請求合併 (Single-Flight)
+用途: 同一個 key 同時只執行一次，其餘並發呼叫者等待並共用同一份結果
+      (例如多位使用者幾秒內同時查詢 2330)，完成後即移除，不做結果快取
+"""
+
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """以 key 合併進行中的呼叫"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self.stats = {"executed": 0, "shared": 0}
+
+    def do(self, key: Hashable, fn: Callable, *args, **kwargs) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = _Call()
+                self._calls[key] = call
+                self.stats["executed"] += 1
+            else:
+                call.waiters += 1
+                self.stats["shared"] += 1
+
+        if not is_leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+
+def flight_key(ticker: str, operation: str, *extra) -> Tuple:
+    """(代號, 交易日, 操作) 作為合併 key，2330 / 2330.TW 視為同一檔"""
+    clean_id = ticker.strip().upper().split('.')[0]
+    return (clean_id, datetime.now().strftime("%Y-%m-%d"), operation) + tuple(extra)
+
+
+# 全局实例 (整個行程共用)
+_flights = SingleFlight()
+
+
+def get_single_flight() -> SingleFlight:
+    """获取全局 SingleFlight 實例"""
+    return _flights
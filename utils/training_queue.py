@@ -14,6 +14,7 @@ import itertools
 import time
 import pandas as pd
 from utils.logger import log_info, log_error, log_warn
+from data.data_loader import request_lane, BATCH
 
 
 QUEUE_FILE = "data/training_queue.json"
@@ -192,8 +193,9 @@ class TrainingQueue:
             self._update_task_status(task_id, "running", 
                                     started_at=datetime.utcnow().isoformat() + "Z")
             
-            # 执行参数网格搜索
-            results = self._execute_grid_search(task, task_id)
+            # 执行参数网格搜索 (批次通道: 不与使用者即时查询抢 FinMind 配额)
+            with request_lane(BATCH):
+                results = self._execute_grid_search(task, task_id)
             
             # 保存结果
             self._update_task_result(task_id, results, "completed")